@@ -13,4 +13,7 @@ db = SQLAlchemy(app)
 migrate = Migrate(app, db)
 
 login_manager = LoginManager(app)
-login_manager.login_view = 'login'
\ No newline at end of file
+login_manager.login_view = 'login'
+
+# Registers the exposure listeners whenever the models are loaded, not only with the routes
+from app import exposure
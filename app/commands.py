@@ -0,0 +1,60 @@
+import time
+
+import click
+
+from app import app
+from app.odds_capture import read_captured_responses
+from app.exposure import check_exposure_consistency, rebuild_exposure
+from app.routes import process_odds_response
+
+@app.cli.command('replay-odds')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--speed', type=float, default=0,
+              help='Replay at this multiple of recorded speed. 0 (the default) replays as fast as possible.')
+def replay_odds(path, speed):
+    """Feed a captured Odds API session through process_odds_response."""
+    replayed = 0
+    skipped = 0
+    previous_captured_at = None
+    started = time.perf_counter()
+
+    for record in read_captured_responses(path):
+        if speed > 0 and previous_captured_at is not None:
+            delay = (record['captured_at'] - previous_captured_at) / speed
+            if delay > 0:
+                time.sleep(delay)
+        previous_captured_at = record['captured_at']
+
+        # Failed calls are recorded for completeness but never reached processing live
+        if record['status_code'] != 200:
+            skipped += 1
+            continue
+
+        process_odds_response(record['payload'], record['sport_name'], record['market_name'])
+        replayed += 1
+
+    elapsed = time.perf_counter() - started
+    rate = replayed / elapsed if elapsed > 0 else 0
+    click.echo(f'Replayed {replayed} responses ({skipped} skipped) in {elapsed:.2f}s, {rate:.1f} responses/s')
+
+@app.cli.command('check-exposure')
+@click.option('--repair', is_flag=True, help='Rebuild the aggregates from the bet table if they are inconsistent.')
+def check_exposure(repair):
+    """Compare the market and event exposure aggregates against a full recompute."""
+    started = time.perf_counter()
+    mismatches = check_exposure_consistency()
+    elapsed = time.perf_counter() - started
+
+    for kind, row_id, stored, expected in mismatches:
+        click.echo(f'{kind} {row_id}: stored (staked, count, payout) {stored}, expected {expected}')
+
+    if not mismatches:
+        click.echo(f'Exposure aggregates are consistent (checked in {elapsed:.2f}s)')
+        return
+
+    click.echo(f'{len(mismatches)} inconsistent aggregates found (checked in {elapsed:.2f}s)')
+    if repair:
+        rebuild_exposure()
+        click.echo('Rebuilt exposure aggregates from the bet table')
+    else:
+        raise SystemExit(1)
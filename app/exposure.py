@@ -0,0 +1,273 @@
+from datetime import datetime
+import math
+
+from sqlalchemy import event, select, case, func, inspect, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import joinedload
+
+from app import db
+from app.models import Bet, Market, MarketExposure, EventExposure
+
+# Running float sums drift from a fresh recompute, so aggregates are compared within these tolerances
+CONSISTENCY_REL_TOLERANCE = 1e-9
+CONSISTENCY_ABS_TOLERANCE = 1e-6
+
+def potential_payout(amount, price):
+    """Total returned to the bettor (stake included) if a bet of amount at American price wins."""
+    if price is None:
+        return amount
+    if price > 0:
+        return amount * (1 + price / 100)
+    if price < 0:
+        return amount * (1 + 100 / -price)
+    return amount
+
+def sql_potential_payout():
+    """SQL equivalent of potential_payout over Bet.amount and Market.price, for full recomputes."""
+    return case(
+        (Market.price > 0, Bet.amount * (1 + Market.price / 100)),
+        (Market.price < 0, Bet.amount * (1 + 100 / -Market.price)),
+        else_=Bet.amount
+    )
+
+def _previous_value(bet, key):
+    history = inspect(bet).attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(bet, key)
+
+def _is_open(included_in_balance):
+    return not included_in_balance
+
+@event.listens_for(db.session, 'before_flush')
+def load_deleted_bets_before_flush(session, flush_context, instances):
+    """Load the attributes of deleted bets while their rows still exist, for the after_flush listener."""
+    for bet in session.deleted:
+        if isinstance(bet, Bet):
+            for key in ('market_id', 'amount', 'included_in_balance'):
+                getattr(bet, key)
+
+@event.listens_for(db.session, 'after_flush')
+def update_exposure_after_flush(session, flush_context):
+    """Apply the exposure change from every Bet placed, settled or deleted in this flush.
+
+    A bet counts towards exposure while it is open, i.e. not yet included_in_balance.
+    The upserts run on the flush's connection, so they commit or roll back with the bets.
+    Bulk Query.update() or delete() on Bet does not go through the flush and is not
+    counted; run rebuild_exposure after any such statement.
+    """
+    stake_changes = {}
+
+    def add_change(market_id, amount, count):
+        staked, bet_count = stake_changes.get(market_id, (0, 0))
+        stake_changes[market_id] = (staked + amount, bet_count + count)
+
+    for bet in session.new:
+        if isinstance(bet, Bet) and _is_open(bet.included_in_balance):
+            add_change(bet.market_id, bet.amount, 1)
+
+    for bet in session.deleted:
+        if isinstance(bet, Bet) and _is_open(_previous_value(bet, 'included_in_balance')):
+            add_change(_previous_value(bet, 'market_id'), -_previous_value(bet, 'amount'), -1)
+
+    for bet in session.dirty:
+        if not isinstance(bet, Bet):
+            continue
+        previous = (
+            _previous_value(bet, 'market_id'),
+            _previous_value(bet, 'amount'),
+            _is_open(_previous_value(bet, 'included_in_balance'))
+        )
+        current = (bet.market_id, bet.amount, _is_open(bet.included_in_balance))
+        if previous == current:
+            continue
+        if previous[2]:
+            add_change(previous[0], -previous[1], -1)
+        if current[2]:
+            add_change(current[0], current[1], 1)
+
+    stake_changes = {market_id: change for market_id, change in stake_changes.items() if change != (0, 0)}
+    if stake_changes:
+        apply_exposure_changes(session.connection(), stake_changes)
+
+def apply_exposure_changes(connection, stake_changes):
+    """Increment market and event aggregates by {market_id: (staked_delta, count_delta)} with one upsert each.
+
+    Rows are upserted in key order so concurrent flushes lock them in the same order and cannot deadlock.
+    """
+    markets = connection.execute(
+        select(Market.id, Market.event_id, Market.price).where(
+            Market.id.in_(stake_changes.keys())
+        ).order_by(Market.id)
+    ).all()
+    if not markets:
+        return
+
+    now = datetime.utcnow()
+    market_rows = []
+    event_rows = {}
+    for market in markets:
+        staked, bet_count = stake_changes[market.id]
+        payout = potential_payout(staked, market.price)
+        market_rows.append({
+            'market_id': market.id,
+            'event_id': market.event_id,
+            'total_staked': staked,
+            'bet_count': bet_count,
+            'potential_payout': payout,
+            'last_updated_time': now
+        })
+        event_row = event_rows.setdefault(market.event_id, {
+            'event_id': market.event_id,
+            'total_staked': 0,
+            'bet_count': 0,
+            'gross_potential_payout': 0,
+            'last_updated_time': now
+        })
+        event_row['total_staked'] += staked
+        event_row['bet_count'] += bet_count
+        event_row['gross_potential_payout'] += payout
+
+    event_rows = [event_rows[event_id] for event_id in sorted(event_rows)]
+    connection.execute(_increment_upsert(
+        connection.dialect.name, MarketExposure, MarketExposure.market_id, market_rows, ['total_staked', 'bet_count', 'potential_payout']
+    ))
+    connection.execute(_increment_upsert(
+        connection.dialect.name, EventExposure, EventExposure.event_id, event_rows, ['total_staked', 'bet_count', 'gross_potential_payout']
+    ))
+
+def _increment_upsert(dialect_name, model, key_column, rows, total_columns):
+    table = model.__table__
+    # SQLite is supported alongside PostgreSQL so the listener can run against a local test database
+    insert = sqlite_insert if dialect_name == 'sqlite' else pg_insert
+    stmt = insert(table).values(rows)
+    set_ = {name: table.c[name] + stmt.excluded[name] for name in total_columns}
+    set_['last_updated_time'] = stmt.excluded.last_updated_time
+    return stmt.on_conflict_do_update(index_elements=[key_column.name], set_=set_)
+
+def top_exposed_markets(limit):
+    return MarketExposure.query.options(
+        joinedload(MarketExposure.market).joinedload(Market.event)
+    ).filter(MarketExposure.bet_count > 0).order_by(
+        MarketExposure.potential_payout.desc()
+    ).limit(limit).all()
+
+def top_exposed_events(limit):
+    """Events with the most open stake. gross_potential_payout is not used for ranking because it overstates liability."""
+    return EventExposure.query.options(
+        joinedload(EventExposure.event)
+    ).filter(EventExposure.bet_count > 0).order_by(
+        EventExposure.total_staked.desc()
+    ).limit(limit).all()
+
+def worst_case_event_payouts(event_ids):
+    """Return {event_id: payout} for the single result that would cost the most on each event.
+
+    Outcomes of one market type (both h2h sides, over and under) are mutually exclusive, so
+    each type contributes its most expensive outcome name. Different types can all win
+    together, so those maxima are summed. Spread markets with different points for the same
+    name are counted together, which keeps this an upper bound.
+    """
+    if not event_ids:
+        return {}
+    rows = db.session.query(
+        MarketExposure.event_id,
+        Market.type,
+        Market.name,
+        func.sum(MarketExposure.potential_payout)
+    ).join(Market, MarketExposure.market_id == Market.id).filter(
+        MarketExposure.event_id.in_(event_ids)
+    ).group_by(MarketExposure.event_id, Market.type, Market.name).all()
+
+    worst_by_type = {}
+    for event_id, market_type, name, payout in rows:
+        key = (event_id, market_type)
+        worst_by_type[key] = max(worst_by_type.get(key, 0), payout)
+
+    payouts = {event_id: 0 for event_id in event_ids}
+    for (event_id, market_type), payout in worst_by_type.items():
+        payouts[event_id] += payout
+    return payouts
+
+def recompute_market_exposure():
+    """Recompute {market_id: (event_id, total_staked, bet_count, potential_payout)} from every open bet."""
+    rows = db.session.query(
+        Bet.market_id,
+        Market.event_id,
+        func.sum(Bet.amount),
+        func.count(Bet.id),
+        func.sum(sql_potential_payout())
+    ).join(Market, Bet.market_id == Market.id).filter(
+        Bet.included_in_balance == False
+    ).group_by(Bet.market_id, Market.event_id).all()
+    return {market_id: (event_id, staked, bet_count, payout) for market_id, event_id, staked, bet_count, payout in rows}
+
+def _totals_differ(stored, expected):
+    stored_staked, stored_count, stored_payout = stored
+    expected_staked, expected_count, expected_payout = expected
+    return (
+        stored_count != expected_count
+        or not _floats_close(stored_staked, expected_staked)
+        or not _floats_close(stored_payout, expected_payout)
+    )
+
+def _floats_close(stored, expected):
+    return math.isclose(stored, expected, rel_tol=CONSISTENCY_REL_TOLERANCE, abs_tol=CONSISTENCY_ABS_TOLERANCE)
+
+def check_exposure_consistency():
+    """Compare the stored aggregates against a full recompute.
+
+    Returns a list of (kind, id, stored, expected) for every market or event whose
+    (total_staked, bet_count, payout) disagree. The payout is potential_payout for
+    markets and gross_potential_payout for events. An empty list means consistent.
+    """
+    expected_markets = recompute_market_exposure()
+    expected_events = {}
+    for event_id, staked, bet_count, payout in expected_markets.values():
+        event_staked, event_count, event_payout = expected_events.get(event_id, (0, 0, 0))
+        expected_events[event_id] = (event_staked + staked, event_count + bet_count, event_payout + payout)
+
+    mismatches = []
+    empty = (0, 0, 0)
+    stored_markets = {
+        exposure.market_id: (exposure.total_staked, exposure.bet_count, exposure.potential_payout)
+        for exposure in MarketExposure.query.all()
+    }
+    for market_id in stored_markets.keys() | expected_markets.keys():
+        stored = stored_markets.get(market_id, empty)
+        expected = expected_markets[market_id][1:] if market_id in expected_markets else empty
+        if _totals_differ(stored, expected):
+            mismatches.append(('market', market_id, stored, expected))
+
+    stored_events = {
+        exposure.event_id: (exposure.total_staked, exposure.bet_count, exposure.gross_potential_payout)
+        for exposure in EventExposure.query.all()
+    }
+    for event_id in stored_events.keys() | expected_events.keys():
+        stored = stored_events.get(event_id, empty)
+        expected = expected_events.get(event_id, empty)
+        if _totals_differ(stored, expected):
+            mismatches.append(('event', event_id, stored, expected))
+
+    return mismatches
+
+def rebuild_exposure():
+    """Replace all stored aggregates with a full recompute from the bet table.
+
+    The aggregate tables are locked first. That waits for in-flight bet transactions, whose
+    upserts hold row locks, to commit so the recompute sees them. Flushes that start later
+    block on their upsert until the rebuild commits and then add on top of it.
+    """
+    db.session.execute(text('LOCK TABLE market_exposure, event_exposure IN EXCLUSIVE MODE'))
+    expected_markets = recompute_market_exposure()
+    db.session.query(MarketExposure).delete(synchronize_session=False)
+    db.session.query(EventExposure).delete(synchronize_session=False)
+
+    stake_changes = {
+        market_id: (staked, bet_count)
+        for market_id, (event_id, staked, bet_count, payout) in expected_markets.items()
+    }
+    if stake_changes:
+        apply_exposure_changes(db.session.connection(), stake_changes)
+    db.session.commit()
@@ -1,4 +1,5 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired, FileAllowed
 from wtforms import StringField, PasswordField, SubmitField, SelectField
 from wtforms.validators import DataRequired, Length, Email
 import pytz
@@ -31,3 +32,7 @@ class FetchOddsForm(FlaskForm):
         ('totals', 'Totals')
     ])
     submit = SubmitField('Fetch Odds')
+
+class BulkAdjustBalancesForm(FlaskForm):
+    csv_file = FileField('CSV File (email, amount, type)', validators=[FileRequired(), FileAllowed(['csv'], 'CSV files only.')])
+    submit = SubmitField('Apply Adjustments')
@@ -82,15 +82,22 @@ class Market(db.Model):
 class Bet(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    market_id = db.Column(db.Integer, db.ForeignKey('market.id'), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    # active_history loads the old value when these are set on an expired bet, so
+    # app.exposure can see what a settlement changed after the bet was committed
+    market_id = db.column_property(db.Column(db.Integer, db.ForeignKey('market.id'), nullable=False), active_history=True)
+    amount = db.column_property(db.Column(db.Float, nullable=False), active_history=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    included_in_balance = db.Column(db.Boolean, default=False, nullable=False)
+    included_in_balance = db.column_property(db.Column(db.Boolean, default=False, nullable=False), active_history=True)
     added_to_balance_time = db.Column(db.DateTime, nullable=True)
 
     user = db.relationship('User', backref=db.backref('bets', lazy='dynamic'))
     market = db.relationship('Market', backref=db.backref('bets', lazy='dynamic'))
 
+    # Supports keyset pagination of a user's bet history over (timestamp, id)
+    __table_args__ = (
+        db.Index('ix_bet_user_id_timestamp_id', 'user_id', 'timestamp', 'id'),
+    )
+
     def __repr__(self):
         return f'<Bet {self.id} - User {self.user_id} - Market {self.market_id} - Amount {self.amount}>'
 
@@ -112,9 +119,45 @@ class Transaction(db.Model):
     user = db.relationship('User', backref=db.backref('transactions', lazy='dynamic'))
     bet = db.relationship('Bet', backref=db.backref('transactions', uselist=False))
 
+    # Supports keyset pagination of a user's transaction history over (timestamp, id)
+    __table_args__ = (
+        db.Index('ix_transaction_user_id_timestamp_id', 'user_id', 'timestamp', 'id'),
+    )
+
     def __repr__(self):
         return f'<Transaction {self.id} - Type: {self.type} - Amount: {self.amount}>'
 
     def is_bet(self):
         """Check if the transaction is bet related."""
-        return self.type in [TransactionType.bet_placed, TransactionType.bet_win, TransactionType.bet_push]
\ No newline at end of file
+        return self.type in [TransactionType.bet_placed, TransactionType.bet_win, TransactionType.bet_push]
+
+class MarketExposure(db.Model):
+    """Running totals over the open (not yet included_in_balance) bets on a market, maintained by app.exposure."""
+    market_id = db.Column(db.Integer, db.ForeignKey('market.id'), primary_key=True)
+    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False)
+    total_staked = db.Column(db.Float, nullable=False, default=0)
+    bet_count = db.Column(db.Integer, nullable=False, default=0)
+    potential_payout = db.Column(db.Float, nullable=False, default=0, index=True)
+    last_updated_time = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    market = db.relationship('Market', backref=db.backref('exposure', uselist=False))
+
+    def __repr__(self):
+        return f'<MarketExposure {self.market_id} - Staked: {self.total_staked} - Payout: {self.potential_payout}>'
+
+class EventExposure(db.Model):
+    """Running totals over the open bets on all markets of an event, maintained by app.exposure.
+
+    gross_potential_payout sums the payouts of every outcome, including outcomes that cannot
+    all win. No single result costs this much. Use app.exposure.worst_case_event_payouts for liability.
+    """
+    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), primary_key=True)
+    total_staked = db.Column(db.Float, nullable=False, default=0, index=True)
+    bet_count = db.Column(db.Integer, nullable=False, default=0)
+    gross_potential_payout = db.Column(db.Float, nullable=False, default=0)
+    last_updated_time = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    event = db.relationship('Event', backref=db.backref('exposure', uselist=False))
+
+    def __repr__(self):
+        return f'<EventExposure {self.event_id} - Staked: {self.total_staked} - Gross Payout: {self.gross_potential_payout}>'
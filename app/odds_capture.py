@@ -0,0 +1,40 @@
+import gzip
+import json
+import logging
+import os
+
+ODDS_CAPTURE_PATH = os.getenv('ODDS_CAPTURE_PATH')
+
+logger = logging.getLogger(__name__)
+
+def capture_odds_response(status_code, payload, sport_name, market_name, params, captured_at):
+    """Append a raw Odds API response to the capture file, if capture mode is on.
+
+    Each record is written as its own gzip member in a single append, so concurrent
+    workers can share one file and gzip.open still reads it back as one NDJSON stream.
+    Write failures are logged rather than raised so capture never blocks ingestion.
+    """
+    if not ODDS_CAPTURE_PATH:
+        return
+
+    record = {
+        'captured_at': captured_at,
+        'sport_name': sport_name,
+        'market_name': market_name,
+        'params': {key: value for key, value in params.items() if key != 'api_key'},
+        'status_code': status_code,
+        'payload': payload
+    }
+    line = json.dumps(record) + '\n'
+    try:
+        with open(ODDS_CAPTURE_PATH, 'ab') as capture_file:
+            capture_file.write(gzip.compress(line.encode('utf-8')))
+    except OSError:
+        logger.exception('Failed to capture Odds API response to %s', ODDS_CAPTURE_PATH)
+
+def read_captured_responses(path):
+    """Yield captured records from a capture file in the order they were recorded."""
+    with gzip.open(path, 'rt', encoding='utf-8') as capture_file:
+        for line in capture_file:
+            if line.strip():
+                yield json.loads(line)
@@ -1,17 +1,31 @@
-from flask import render_template, redirect, url_for, flash, request
+from flask import render_template, redirect, url_for, flash, request, jsonify, Response, stream_with_context
 from app import app, db
 from app.models import User, LogEntry, Market, Bet, Event, MarketStatus, MarketType, Transaction, TransactionType
 from flask_login import login_user, logout_user, login_required, current_user, LoginManager
-from app.forms import RegistrationForm, LoginForm, AdminPasswordResetForm, FetchOddsForm
+from app.forms import RegistrationForm, LoginForm, AdminPasswordResetForm, FetchOddsForm, BulkAdjustBalancesForm
+from app.odds_capture import capture_odds_response
+from app.exposure import top_exposed_markets, top_exposed_events, worst_case_event_payouts
+from sqlalchemy import tuple_, insert, update, values, column, func, Integer, Float
+from sqlalchemy.orm import joinedload
 from functools import wraps
 import os
 import requests
 import json
+import csv
+import io
+import math
+import time
 from datetime import datetime
 
 ADMIN_EMAIL = os.getenv('ADMIN_EMAIL')
 ODDS_API_KEY = os.getenv('ODDS_API_KEY')
 
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+EXPORT_BATCH_SIZE = 500
+EXPOSURE_PAGE_SIZE = 20
+EXPOSURE_MAX_PAGE_SIZE = 100
+
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -122,6 +136,197 @@ def admin_fetch_odds():
         flash('Odds fetched successfully.', 'success')
     return render_template('admin/fetch_odds.html', form=form)
 
+@app.route('/admin/bulk_adjust', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def admin_bulk_adjust():
+    form = BulkAdjustBalancesForm()
+    if form.validate_on_submit():
+        started = time.perf_counter()
+        try:
+            rows = parse_bulk_adjustments(form.csv_file.data)
+            apply_bulk_adjustments(rows, current_user)
+        except BulkAdjustmentError as e:
+            db.session.rollback()
+            for message in e.errors:
+                flash(message, 'danger')
+            flash('No adjustments were applied.', 'danger')
+            return render_template('admin/bulk_adjust.html', form=form)
+        except Exception:
+            db.session.rollback()
+            raise
+
+        elapsed = time.perf_counter() - started
+        rate = len(rows) / elapsed if elapsed > 0 else 0
+        flash(f'Applied {len(rows)} adjustments in {elapsed:.3f}s ({rate:.0f} rows/s).', 'success')
+        return redirect(url_for('admin_bulk_adjust'))
+    return render_template('admin/bulk_adjust.html', form=form)
+
+@app.route('/admin/exposure')
+@login_required
+@admin_required
+def admin_exposure():
+    limit = min(request.args.get('limit', EXPOSURE_PAGE_SIZE, type=int), EXPOSURE_MAX_PAGE_SIZE)
+    if limit < 1:
+        return jsonify({'error': 'limit must be positive'}), 400
+
+    markets = []
+    for exposure in top_exposed_markets(limit):
+        item = serialize_market(exposure.market)
+        item.update({
+            'total_staked': exposure.total_staked,
+            'bet_count': exposure.bet_count,
+            'potential_payout': exposure.potential_payout
+        })
+        markets.append(item)
+
+    event_exposures = top_exposed_events(limit)
+    worst_case_payouts = worst_case_event_payouts([exposure.event_id for exposure in event_exposures])
+    events = [{
+        'event_id': exposure.event_id,
+        'sport_title': exposure.event.sport_title,
+        'home_team': exposure.event.home_team,
+        'away_team': exposure.event.away_team,
+        'total_staked': exposure.total_staked,
+        'bet_count': exposure.bet_count,
+        'worst_case_payout': worst_case_payouts[exposure.event_id],
+        'gross_potential_payout': exposure.gross_potential_payout
+    } for exposure in event_exposures]
+
+    return jsonify({'markets': markets, 'events': events})
+
+
+class BulkAdjustmentError(Exception):
+    def __init__(self, errors):
+        super().__init__('; '.join(errors))
+        self.errors = errors
+
+BULK_ADJUSTMENT_TYPES = {
+    'deposit': TransactionType.deposit,
+    'withdrawal': TransactionType.withdrawal
+}
+BULK_ADJUSTMENT_MAX_AMOUNT = 1000000
+
+def parse_bulk_adjustments(csv_file):
+    """Read (email, amount, type) rows from an uploaded CSV. Raises BulkAdjustmentError listing every bad row."""
+    try:
+        reader = csv.DictReader(io.StringIO(csv_file.read().decode('utf-8-sig')))
+        fieldnames = reader.fieldnames or []
+        csv_rows = list(reader)
+    except (UnicodeDecodeError, csv.Error):
+        raise BulkAdjustmentError(['File is not valid UTF-8 CSV.'])
+
+    missing_columns = {'email', 'amount', 'type'} - set(fieldnames)
+    if missing_columns:
+        raise BulkAdjustmentError([f"Missing columns: {', '.join(sorted(missing_columns))}"])
+
+    rows = []
+    errors = []
+    # Line 1 is the header
+    for line_number, row in enumerate(csv_rows, start=2):
+        # Emails are matched case-insensitively, since registration stores them as typed
+        email = (row['email'] or '').strip().lower()
+        transaction_type = BULK_ADJUSTMENT_TYPES.get((row['type'] or '').strip().lower())
+        try:
+            amount = float(row['amount'])
+        except (TypeError, ValueError):
+            amount = None
+
+        row_errors = []
+        if not email:
+            row_errors.append(f'Line {line_number}: missing email.')
+        if amount is None or not math.isfinite(amount) or not 0 < amount <= BULK_ADJUSTMENT_MAX_AMOUNT:
+            row_errors.append(f'Line {line_number}: amount must be a positive number no greater than {BULK_ADJUSTMENT_MAX_AMOUNT}.')
+        if transaction_type is None:
+            row_errors.append(f'Line {line_number}: type must be deposit or withdrawal.')
+        errors.extend(row_errors)
+        if not row_errors:
+            rows.append((line_number, email, amount, transaction_type))
+
+    if errors:
+        raise BulkAdjustmentError(errors)
+    if not rows:
+        raise BulkAdjustmentError(['The CSV file has no rows.'])
+    return rows
+
+def apply_bulk_adjustments(rows, actor):
+    """Write all transactions and balance changes for a parsed batch in one database transaction.
+
+    Users are looked up case-insensitively and row-locked in one query. Transactions and
+    per-user LogEntry rows go in with one multi-row INSERT each, and balances change with
+    one UPDATE ... FROM (VALUES ...). Nothing is committed unless every row is valid.
+    """
+    emails = {email for _, email, _, _ in rows}
+    users = db.session.query(User.id, User.email, User.balance).filter(
+        func.lower(User.email).in_(emails)
+    ).with_for_update().all()
+
+    errors = []
+    users_by_email = {}
+    for user in users:
+        if user.email.lower() in users_by_email:
+            errors.append(f'{user.email}: more than one user has this email ignoring case.')
+        users_by_email[user.email.lower()] = user
+    deltas = {}
+    transaction_rows = []
+    now = datetime.utcnow()
+    for line_number, email, amount, transaction_type in rows:
+        user = users_by_email.get(email)
+        if user is None:
+            errors.append(f'Line {line_number}: no user with email {email}.')
+            continue
+        # Transaction amounts are signed so they sum to the balance change
+        signed_amount = amount if transaction_type == TransactionType.deposit else -amount
+        deltas[user.id] = deltas.get(user.id, 0) + signed_amount
+        transaction_rows.append({
+            'user_id': user.id,
+            'amount': signed_amount,
+            'type': transaction_type,
+            'timestamp': now
+        })
+
+    for user in users:
+        if user.id not in deltas:
+            continue
+        new_balance = user.balance + deltas[user.id]
+        if not math.isfinite(new_balance):
+            errors.append(f'{user.email}: adjustments do not give a finite balance.')
+        elif new_balance < 0:
+            errors.append(f'{user.email}: withdrawals exceed balance of {user.balance:.2f}.')
+
+    if errors:
+        raise BulkAdjustmentError(errors)
+
+    db.session.execute(insert(Transaction).values(transaction_rows))
+
+    adjustments = values(
+        column('user_id', Integer), column('delta', Float), name='adjustments'
+    ).data(list(deltas.items()))
+    db.session.execute(
+        update(User)
+        .where(User.id == adjustments.c.user_id)
+        .values(balance=User.balance + adjustments.c.delta)
+        .execution_options(synchronize_session=False)
+    )
+
+    row_counts = {}
+    for transaction_row in transaction_rows:
+        row_counts[transaction_row['user_id']] = row_counts.get(transaction_row['user_id'], 0) + 1
+    log_rows = [{
+        'timestamp': now,
+        'actor_id': actor.id,
+        'category': 'Bulk Adjust Balances',
+        'description': f"{actor.email} adjusted balance of {user.email} by {deltas[user.id]:+.2f} ({row_counts[user.id]} rows)"
+    } for user in users if user.id in deltas]
+    log_rows.append({
+        'timestamp': now,
+        'actor_id': actor.id,
+        'category': 'Bulk Adjust Balances',
+        'description': f"{actor.email} applied {len(transaction_rows)} adjustments to {len(deltas)} users"
+    })
+    db.session.execute(insert(LogEntry).values(log_rows))
+    db.session.commit()
+
 
 def make_odds_api_call(sport_name, market_name):
     api_url = f"https://api.the-odds-api.com/v4/sports/{sport_name}/odds"
@@ -133,11 +338,14 @@ def make_odds_api_call(sport_name, market_name):
         'api_key': ODDS_API_KEY
     }
     response = requests.get(api_url, params=params)
+    captured_at = time.time()
     if response.status_code == 200:
         odds_data = response.json()
-        process_odds_response(odds_data, sport_name, market_name)
+        capture_odds_response(response.status_code, odds_data, sport_name, market_name, params, captured_at)
         # Process the odds data here
+        process_odds_response(odds_data, sport_name, market_name)
     else:
+        capture_odds_response(response.status_code, response.text, sport_name, market_name, params, captured_at)
         flash('Failed to fetch odds from the API.', 'danger')
 
 def process_odds_response(odds_data, sport_name, market_name):
@@ -207,3 +415,156 @@ def update_existing_markets(sport_name, market_name):
             Market.last_updated_time: datetime.utcnow()
         }, synchronize_session=False)
         db.session.commit()
+
+
+@app.route('/api/bets')
+@login_required
+def api_bet_history():
+    query = Bet.query.filter(Bet.user_id == current_user.id).options(
+        joinedload(Bet.market).joinedload(Market.event)
+    )
+    return history_page_response(query, Bet, serialize_bet)
+
+@app.route('/api/transactions')
+@login_required
+def api_transaction_history():
+    query = Transaction.query.filter(Transaction.user_id == current_user.id).options(
+        joinedload(Transaction.bet).joinedload(Bet.market).joinedload(Market.event)
+    )
+    return history_page_response(query, Transaction, serialize_transaction)
+
+@app.route('/export/bets')
+@login_required
+def export_bet_history():
+    query = Bet.query.filter(Bet.user_id == current_user.id).options(
+        joinedload(Bet.market).joinedload(Market.event)
+    )
+    return history_export_response(query, Bet, serialize_bet, BET_EXPORT_FIELDS, 'bets')
+
+@app.route('/export/transactions')
+@login_required
+def export_transaction_history():
+    query = Transaction.query.filter(Transaction.user_id == current_user.id).options(
+        joinedload(Transaction.bet).joinedload(Bet.market).joinedload(Market.event)
+    )
+    return history_export_response(query, Transaction, serialize_transaction, TRANSACTION_EXPORT_FIELDS, 'transactions')
+
+
+def encode_history_cursor(row):
+    return f"{row.timestamp.isoformat()}_{row.id}"
+
+def decode_history_cursor(cursor):
+    """Split a cursor from encode_history_cursor into (timestamp, id). Raises ValueError if malformed."""
+    timestamp, _, row_id = cursor.rpartition('_')
+    return datetime.fromisoformat(timestamp), int(row_id)
+
+def history_page_response(query, model, serialize):
+    """Return one newest-first page of history, seeking past the cursor on (timestamp, id) instead of using OFFSET."""
+    limit = min(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), HISTORY_MAX_PAGE_SIZE)
+    if limit < 1:
+        return jsonify({'error': 'limit must be positive'}), 400
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            timestamp, row_id = decode_history_cursor(cursor)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        query = query.filter(tuple_(model.timestamp, model.id) < tuple_(timestamp, row_id))
+
+    # Fetch one extra row to find out whether another page exists
+    rows = query.order_by(model.timestamp.desc(), model.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_history_cursor(rows[-1])
+
+    return jsonify({
+        'items': [serialize(row) for row in rows],
+        'next_cursor': next_cursor
+    })
+
+def history_export_response(query, model, serialize, fieldnames, name):
+    """Stream the full history as CSV or NDJSON, reading rows through a server-side cursor."""
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+
+    rows = query.order_by(model.timestamp.desc(), model.id.desc()).yield_per(EXPORT_BATCH_SIZE)
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fieldnames)
+        writer.writeheader()
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        for row in rows:
+            writer.writerow(serialize(row))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    def generate_ndjson():
+        for row in rows:
+            yield json.dumps(serialize(row)) + '\n'
+
+    if export_format == 'csv':
+        generator, mimetype = generate_csv(), 'text/csv'
+    else:
+        generator, mimetype = generate_ndjson(), 'application/x-ndjson'
+
+    return Response(
+        stream_with_context(generator),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={name}.{export_format}'}
+    )
+
+MARKET_EXPORT_FIELDS = [
+    'market_id', 'market_name', 'market_type', 'market_status', 'price', 'point',
+    'event_id', 'sport_title', 'home_team', 'away_team', 'commence_time'
+]
+BET_EXPORT_FIELDS = ['id', 'timestamp', 'amount', 'included_in_balance'] + MARKET_EXPORT_FIELDS
+TRANSACTION_EXPORT_FIELDS = [
+    'id', 'timestamp', 'type', 'amount', 'bet_id', 'market_name', 'event_id', 'home_team', 'away_team'
+]
+
+def serialize_market(market):
+    event = market.event
+    return {
+        'market_id': market.id,
+        'market_name': market.name,
+        'market_type': market.type.value,
+        'market_status': market.status.value,
+        'price': market.price,
+        'point': market.point,
+        'event_id': event.id,
+        'sport_title': event.sport_title,
+        'home_team': event.home_team,
+        'away_team': event.away_team,
+        'commence_time': event.commence_time.isoformat() if event.commence_time else None
+    }
+
+def serialize_bet(bet):
+    item = {
+        'id': bet.id,
+        'timestamp': bet.timestamp.isoformat(),
+        'amount': bet.amount,
+        'included_in_balance': bet.included_in_balance
+    }
+    item.update(serialize_market(bet.market))
+    return item
+
+def serialize_transaction(transaction):
+    market = transaction.bet.market if transaction.bet else None
+    return {
+        'id': transaction.id,
+        'timestamp': transaction.timestamp.isoformat(),
+        'type': transaction.type.value,
+        'amount': transaction.amount,
+        'bet_id': transaction.bet_id,
+        'market_name': market.name if market else None,
+        'event_id': market.event.id if market else None,
+        'home_team': market.event.home_team if market else None,
+        'away_team': market.event.away_team if market else None
+    }
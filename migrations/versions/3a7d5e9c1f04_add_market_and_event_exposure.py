@@ -0,0 +1,76 @@
+"""Add market and event exposure
+
+Revision ID: 3a7d5e9c1f04
+Revises: 8e1f4a2b7c93
+Create Date: 2026-10-19 14:31:08.527716
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3a7d5e9c1f04'
+down_revision = '8e1f4a2b7c93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('market_exposure',
+    sa.Column('market_id', sa.Integer(), nullable=False),
+    sa.Column('event_id', sa.Integer(), nullable=False),
+    sa.Column('total_staked', sa.Float(), nullable=False),
+    sa.Column('bet_count', sa.Integer(), nullable=False),
+    sa.Column('potential_payout', sa.Float(), nullable=False),
+    sa.Column('last_updated_time', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['event_id'], ['event.id'], ),
+    sa.ForeignKeyConstraint(['market_id'], ['market.id'], ),
+    sa.PrimaryKeyConstraint('market_id')
+    )
+    with op.batch_alter_table('market_exposure', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_market_exposure_potential_payout'), ['potential_payout'], unique=False)
+
+    op.create_table('event_exposure',
+    sa.Column('event_id', sa.Integer(), nullable=False),
+    sa.Column('total_staked', sa.Float(), nullable=False),
+    sa.Column('bet_count', sa.Integer(), nullable=False),
+    sa.Column('gross_potential_payout', sa.Float(), nullable=False),
+    sa.Column('last_updated_time', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['event_id'], ['event.id'], ),
+    sa.PrimaryKeyConstraint('event_id')
+    )
+    with op.batch_alter_table('event_exposure', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_event_exposure_total_staked'), ['total_staked'], unique=False)
+
+    # Backfill from the open bets already placed, so the incremental updates start from correct totals
+    op.execute("""
+        INSERT INTO market_exposure (market_id, event_id, total_staked, bet_count, potential_payout, last_updated_time)
+        SELECT market.id, market.event_id, SUM(bet.amount), COUNT(bet.id),
+            SUM(CASE
+                WHEN market.price > 0 THEN bet.amount * (1 + market.price / 100)
+                WHEN market.price < 0 THEN bet.amount * (1 + 100 / -market.price)
+                ELSE bet.amount
+            END),
+            timezone('utc', now())
+        FROM bet JOIN market ON bet.market_id = market.id
+        WHERE NOT bet.included_in_balance
+        GROUP BY market.id, market.event_id
+    """)
+    op.execute("""
+        INSERT INTO event_exposure (event_id, total_staked, bet_count, gross_potential_payout, last_updated_time)
+        SELECT event_id, SUM(total_staked), SUM(bet_count), SUM(potential_payout), timezone('utc', now())
+        FROM market_exposure
+        GROUP BY event_id
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('event_exposure', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_event_exposure_total_staked'))
+
+    op.drop_table('event_exposure')
+    with op.batch_alter_table('market_exposure', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_market_exposure_potential_payout'))
+
+    op.drop_table('market_exposure')
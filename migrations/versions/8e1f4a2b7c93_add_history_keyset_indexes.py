@@ -0,0 +1,32 @@
+"""Add history keyset indexes to bet and transaction
+
+Revision ID: 8e1f4a2b7c93
+Revises: c6baa96ec5e5
+Create Date: 2026-10-19 09:12:40.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e1f4a2b7c93'
+down_revision = 'c6baa96ec5e5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('bet', schema=None) as batch_op:
+        batch_op.create_index('ix_bet_user_id_timestamp_id', ['user_id', 'timestamp', 'id'], unique=False)
+
+    with op.batch_alter_table('transaction', schema=None) as batch_op:
+        batch_op.create_index('ix_transaction_user_id_timestamp_id', ['user_id', 'timestamp', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('transaction', schema=None) as batch_op:
+        batch_op.drop_index('ix_transaction_user_id_timestamp_id')
+
+    with op.batch_alter_table('bet', schema=None) as batch_op:
+        batch_op.drop_index('ix_bet_user_id_timestamp_id')
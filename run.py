@@ -1,5 +1,6 @@
 from app import app
 from app import routes
+from app import commands
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,67 @@
+import os
+
+# Never run against the configured database; the tables are created and dropped here
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL', 'sqlite://')
+
+import pytest
+
+from app import app, db
+from app.models import User, Event, Market, MarketType, Bet, MarketExposure, EventExposure
+from app.exposure import check_exposure_consistency
+
+@pytest.fixture
+def session():
+    with app.app_context():
+        db.create_all()
+        yield db.session
+        db.session.remove()
+        db.drop_all()
+
+def make_market(session):
+    user = User(email='bettor@example.com')
+    event = Event(event_id='event-1', home_team='Home', away_team='Away')
+    session.add_all([user, event])
+    session.commit()
+    market = Market(event_id=event.id, name='Home', price=100, type=MarketType.h2h)
+    session.add(market)
+    session.commit()
+    return user, market
+
+def exposure_totals(exposure):
+    return (exposure.total_staked, exposure.bet_count, exposure.potential_payout)
+
+def test_placing_bets_adds_to_exposure(session):
+    user, market = make_market(session)
+    session.add_all([Bet(user_id=user.id, market_id=market.id, amount=10) for _ in range(3)])
+    session.commit()
+
+    assert exposure_totals(session.get(MarketExposure, market.id)) == (30, 3, 60)
+    event_exposure = session.get(EventExposure, market.event_id)
+    assert (event_exposure.total_staked, event_exposure.bet_count, event_exposure.gross_potential_payout) == (30, 3, 60)
+    assert check_exposure_consistency() == []
+
+def test_settling_bets_after_commit_removes_them_from_exposure(session):
+    user, market = make_market(session)
+    bets = [Bet(user_id=user.id, market_id=market.id, amount=10) for _ in range(3)]
+    session.add_all(bets)
+    session.commit()
+
+    # Each commit expires the remaining bets, so every settlement sets an expired attribute
+    for bet in bets:
+        bet.included_in_balance = True
+        session.commit()
+
+    assert exposure_totals(session.get(MarketExposure, market.id)) == (0, 0, 0)
+    assert check_exposure_consistency() == []
+
+def test_deleting_open_bet_after_commit_removes_it_from_exposure(session):
+    user, market = make_market(session)
+    bets = [Bet(user_id=user.id, market_id=market.id, amount=10) for _ in range(2)]
+    session.add_all(bets)
+    session.commit()
+
+    session.delete(bets[0])
+    session.commit()
+
+    assert exposure_totals(session.get(MarketExposure, market.id)) == (10, 1, 20)
+    assert check_exposure_consistency() == []